@@ -7,11 +7,52 @@ import pandas as pd
 import plotly.express as px
 import numpy as np
 import io
+import os
+import json
+
+from date_parser import parse_dates, CLEANED_DATE_FORMAT
+
+DATA_FILE = r'C:\Users\Humayun\Dashboard\Cleaned_Crimes_in_Chicago.csv'
+OUTPUT_FOLDER = r'C:\Users\Humayun\Competition'    # Same as OUTPUT_FOLDER in ETL Script.py
+PARQUET_FILE = os.path.join(OUTPUT_FOLDER, 'Cleaned_Crimes_in_Chicago.parquet')
+STATUS_FILE = os.path.join(OUTPUT_FOLDER, 'etl_status.json')    # Written by the ETL watch-folder service
+RELOAD_INTERVAL = 30    # Seconds between checks for new ETL output
+
+# List the ETL outputs to load; the status file is re-read on every rerun
+def find_data_files():
+    # In watch mode, combine the outputs of every extract that finished
+    if os.path.exists(STATUS_FILE):
+        with open(STATUS_FILE) as f:
+            status = json.load(f)
+        outputs = [info['output'] for info in status['files'].values()
+                   if info.get('state') == 'done' and info.get('output') and os.path.exists(info['output'])]
+        if outputs:
+            return sorted(outputs, key=os.path.getmtime)
+    # Prefer the Parquet output of the ETL, where Date is already datetime64
+    if os.path.exists(PARQUET_FILE):
+        return [PARQUET_FILE]
+    return [DATA_FILE]
+
+def find_data_versions():
+    data_files = find_data_files()
+    return data_files, [os.path.getmtime(data_file) for data_file in data_files]
+
+def read_data_file(data_file):
+    if data_file.endswith('.parquet'):
+        return pd.read_parquet(data_file)
+    data = pd.read_csv(data_file)
+    data['Date'] = parse_dates(data['Date'], CLEANED_DATE_FORMAT)
+    return data
 
 # Load Processed Data with sampling to reduce memory usage
-@st.cache_data
-def load_data():
-    full_df = pd.read_csv(r'C:\Users\Humayun\Dashboard\Cleaned_Crimes_in_Chicago.csv', parse_dates=['Date'])
+# modified_times is only part of the cache key, so new or rewritten ETL output triggers a reload
+# Only the current data is kept, so old versions do not pile up in memory
+@st.cache_data(max_entries=1)
+def load_data(data_files, modified_times=None):
+    full_df = pd.concat([read_data_file(data_file) for data_file in data_files], ignore_index=True)
+    # Overlapping extracts repeat incidents; keep the copy from the newest extract
+    if len(data_files) > 1:
+        full_df = full_df.drop_duplicates(subset='ID', keep='last')
     # Use 70% of the data to reduce memory usage
     sampled_df = full_df.sample(frac=0.5, random_state=42)
     return sampled_df
@@ -20,7 +61,15 @@ def load_data():
 def convert_df_to_csv(df):
     return df.to_csv(index=False).encode('utf-8')
 
-df = load_data()
+# Rerun the whole app when the ETL has written new output since this run loaded its data
+@st.fragment(run_every=RELOAD_INTERVAL)
+def watch_for_new_data(loaded_versions):
+    if find_data_versions() != loaded_versions:
+        st.rerun()
+
+data_files, modified_times = find_data_versions()
+df = load_data(data_files, modified_times)
+watch_for_new_data((data_files, modified_times))
 
 # Streamlit Page Setup - Title and caption
 st.title("Chicago Crime Dashboard (2012-2017)")
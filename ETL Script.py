@@ -7,6 +7,16 @@ import numpy as np
 import sqlite3
 from datetime import datetime
 import os
+import json
+import time
+import shutil
+import argparse
+import threading
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from date_parser import parse_dates
+from query_engine import count_rows, duckdb
 
 # ------------------------------
 # PARAMETERS
@@ -17,6 +27,18 @@ INPUT_FILE = r"C:\Users\Humayun\Downloads\Chicago_Crimes_2012_to_2017 (1)\Chicag
 DB_FILE = 'crimes_cleaned.db'
 OUTPUT_FOLDER = r'C:\Users\Humayun\Competition'
 SAVE_TO_DB = True
+SAVE_TO_PARQUET = True
+
+# Watch-folder service mode
+WATCH_FOLDER = r'C:\Users\Humayun\Incoming'
+POLL_INTERVAL = 30    # Seconds between scans of the watch folder
+MAX_WORKERS = 2       # Extracts processed at the same time
+MAX_RETRY_DELAY = 3600    # Longest wait in seconds before a failed extract is retried
+STATUS_FILE_NAME = 'etl_status.json'
+
+# Query engine for the aggregation stage: 'duckdb' or 'pandas'
+QUERY_ENGINE = 'duckdb'
+BENCHMARK_SIZES = [10_000, 100_000, 1_000_000]    # Rows per synthetic benchmark run
 
 # Create output folder if it does not exist
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
@@ -33,7 +55,7 @@ def load_data(file_path):
 
 def clean_data(df):
     # Fix Date column
-    df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+    df['Date'] = parse_dates(df['Date'])
     
     # Remove duplicates
     df = df.drop_duplicates()
@@ -114,13 +136,15 @@ def feature_engineering(df):
     df = df.sort_values('Date')
 
     # Create a daily incident count
-    daily_counts = df.groupby(df['Date'].dt.date).size().reset_index(name='Daily_Incidents')
+    daily_counts = df.groupby(df['Date'].dt.normalize().rename('Day_Date')).size().reset_index(name='Daily_Incidents')
 
     # Rolling 7-day average
     daily_counts['Rolling_7D_Avg'] = daily_counts['Daily_Incidents'].rolling(window=7, min_periods=1).mean()
 
     # Merge rolling average back to incidents
-    df = df.merge(daily_counts[['Date', 'Rolling_7D_Avg']], left_on=df['Date'].dt.date, right_on='Date', how='left')
+    # Merge on a helper day column so Date keeps its datetime64 dtype
+    df['Day_Date'] = df['Date'].dt.normalize()
+    df = df.merge(daily_counts[['Day_Date', 'Rolling_7D_Avg']], on='Day_Date', how='left').drop(columns='Day_Date')
 
         #spatial density
     # Total number of incidents per Community Area
@@ -168,9 +192,17 @@ def save_to_db(incidents, locations, crime_types, db_file):
     crime_types.to_sql('Crime_Types', conn, if_exists='replace', index=False)
     conn.close()
 
-def reshape_data(df):
+def save_to_parquet(df, output_folder):
+    # Parquet keeps Date as datetime64 so the dashboard never re-parses text
+    if not pd.api.types.is_datetime64_any_dtype(df['Date']):
+        raise ValueError(f"Date must be datetime64 before writing Parquet, got {df['Date'].dtype}")
+    df.to_parquet(os.path.join(output_folder, 'Cleaned_Crimes_in_Chicago.parquet'), index=False)
+
+def reshape_data(df, engine=QUERY_ENGINE, parquet_file=None):
     # Group by Year, Month, Primary Type
-    crime_counts = df.groupby(['Year', 'Month', 'Primary Type']).size().reset_index(name='Crime_Count')
+    # DuckDB scans the Parquet output; pandas uses the frame already in memory
+    source = parquet_file if engine == 'duckdb' and parquet_file else df
+    crime_counts = count_rows(source, ['Year', 'Month', 'Primary Type'], 'Crime_Count', engine)
     
     # Pivot
     crime_pivot = crime_counts.pivot_table(index=['Year', 'Month'], columns='Primary Type', values='Crime_Count', fill_value=0)
@@ -179,35 +211,271 @@ def reshape_data(df):
     return crime_counts, crime_pivot
 
 # ------------------------------
-# MAIN EXECUTION
+# PIPELINE
 # ------------------------------
 
-if __name__ == "__main__":
-    print("[INFO] Starting ETL pipeline...")
-    
-    df = load_data(INPUT_FILE)
-    print(f"[INFO] Loaded {len(df)} rows.")
-    
-    df = clean_data(df)
-    print(f"[INFO] Cleaned data. {len(df)} rows remaining.")
-    
-    df = feature_engineering(df)
-    print("[INFO] Feature engineering done.")
-    
+def checkpoint_path(checkpoint_dir, stage):
+    return os.path.join(checkpoint_dir, f'{stage}.pkl')
+
+def input_fingerprint(input_file):
+    stat = os.stat(input_file)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def read_fingerprint(checkpoint_dir):
+    fingerprint_file = os.path.join(checkpoint_dir, 'source.json')
+    if not os.path.exists(fingerprint_file):
+        return None
+    with open(fingerprint_file) as f:
+        return json.load(f)
+
+def run_pipeline(input_file, output_folder, db_file=DB_FILE, checkpoint_dir=None, on_stage=None, engine=QUERY_ENGINE):
+    os.makedirs(output_folder, exist_ok=True)
+
+    stages = [
+        ('load', lambda df: load_data(input_file)),
+        ('clean', clean_data),
+        ('features', feature_engineering),
+    ]
+
+    # Resume from the last finished stage instead of starting over
+    start = 0
+    df = None
+    if checkpoint_dir:
+        # Checkpoints from a different version of the input file are stale
+        fingerprint = input_fingerprint(input_file)
+        if os.path.exists(checkpoint_dir) and read_fingerprint(checkpoint_dir) != fingerprint:
+            print(f"[INFO] {os.path.basename(input_file)} changed since its checkpoints were written, starting over.")
+            shutil.rmtree(checkpoint_dir)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(os.path.join(checkpoint_dir, 'source.json'), 'w') as f:
+            json.dump(fingerprint, f)
+
+        for i, (stage, _) in enumerate(stages):
+            if os.path.exists(checkpoint_path(checkpoint_dir, stage)):
+                start = i + 1
+        if start:
+            df = pd.read_pickle(checkpoint_path(checkpoint_dir, stages[start - 1][0]))
+            print(f"[INFO] Resuming {os.path.basename(input_file)} after '{stages[start - 1][0]}' stage.")
+
+    for stage, func in stages[start:]:
+        df = func(df)
+        print(f"[INFO] {os.path.basename(input_file)}: '{stage}' stage done. {len(df)} rows.")
+        if checkpoint_dir:
+            # Write to a temp file first so a crash never leaves a half-written checkpoint
+            tmp_path = checkpoint_path(checkpoint_dir, stage) + '.tmp'
+            df.to_pickle(tmp_path)
+            os.replace(tmp_path, checkpoint_path(checkpoint_dir, stage))
+        if on_stage:
+            on_stage(stage)
+
     incidents, locations, crime_types = normalize_tables(df)
     
     if SAVE_TO_DB:
-        save_to_db(incidents, locations, crime_types, DB_FILE)
-        print(f"[INFO] Data saved to {DB_FILE}")
+        save_to_db(incidents, locations, crime_types, db_file)
+        print(f"[INFO] Data saved to {db_file}")
     
-    crime_counts, crime_pivot = reshape_data(df)
+    parquet_file = os.path.join(output_folder, 'Cleaned_Crimes_in_Chicago.parquet')
+    if SAVE_TO_PARQUET:
+        save_to_parquet(df, output_folder)
+        print(f"[INFO] Cleaned data saved to {output_folder}")
+    
+    # Aggregate straight from the Parquet output when there is one
+    crime_counts, crime_pivot = reshape_data(df, engine, parquet_file if SAVE_TO_PARQUET else None)
     print("[INFO] Data reshaped for analysis.")
     
     # Save outputs if needed
-    incidents.to_csv(f"{OUTPUT_FOLDER}incidents.csv", index=False)
-    locations.to_csv(f"{OUTPUT_FOLDER}locations.csv", index=False)
-    crime_types.to_csv(f"{OUTPUT_FOLDER}crime_types.csv", index=False)
-    crime_counts.to_csv(f"{OUTPUT_FOLDER}crime_counts_unpivot.csv", index=False)
-    crime_pivot.to_csv(f"{OUTPUT_FOLDER}crime_monthly_pivot.csv", index=False)
-    
-    print("[SUCCESS] Pipeline finished successfully!")
+    incidents.to_csv(os.path.join(output_folder, 'incidents.csv'), index=False)
+    locations.to_csv(os.path.join(output_folder, 'locations.csv'), index=False)
+    crime_types.to_csv(os.path.join(output_folder, 'crime_types.csv'), index=False)
+    crime_counts.to_csv(os.path.join(output_folder, 'crime_counts_unpivot.csv'), index=False)
+    crime_pivot.to_csv(os.path.join(output_folder, 'crime_monthly_pivot.csv'), index=False)
+
+    # Outputs are complete, so the checkpoints are no longer needed
+    if checkpoint_dir:
+        shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    if on_stage:
+        on_stage('save')
+
+    return parquet_file
+
+# ------------------------------
+# WATCH-FOLDER SERVICE
+# ------------------------------
+
+status_lock = threading.Lock()
+
+def read_status(status_file):
+    if not os.path.exists(status_file):
+        return {'last_updated': None, 'files': {}}
+    with open(status_file) as f:
+        return json.load(f)
+
+def update_status(status_file, file_name, **fields):
+    # The dashboard polls this file, so replace it atomically
+    with status_lock:
+        status = read_status(status_file)
+        status['files'].setdefault(file_name, {}).update(fields)
+        status['last_updated'] = datetime.now().isoformat(timespec='seconds')
+        tmp_file = status_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(tmp_file, status_file)
+
+def process_file(input_file, output_folder, status_file, engine=QUERY_ENGINE):
+    file_name = os.path.basename(input_file)
+    file_stem = os.path.splitext(file_name)[0]
+    file_output = os.path.join(output_folder, file_stem)
+    checkpoint_dir = os.path.join(output_folder, 'checkpoints', file_stem)
+
+    update_status(status_file, file_name, state='running', error=None)
+    try:
+        # Taken before the run, so a file replaced mid-run is processed again
+        fingerprint = input_fingerprint(input_file)
+        parquet_file = run_pipeline(
+            input_file, file_output,
+            db_file=os.path.join(file_output, DB_FILE),
+            checkpoint_dir=checkpoint_dir,
+            on_stage=lambda stage: update_status(status_file, file_name, stage=stage),
+            engine=engine,
+        )
+    except Exception as e:
+        update_status(status_file, file_name, state='failed', error=str(e))
+        print(f"[ERROR] {file_name} failed: {e}")
+        return None
+    update_status(status_file, file_name, state='done', fingerprint=fingerprint,
+                  output=parquet_file if SAVE_TO_PARQUET else None)
+    print(f"[SUCCESS] {file_name} processed.")
+    return fingerprint
+
+def watch_folder(watch_dir, output_folder, poll_interval=POLL_INTERVAL, max_workers=MAX_WORKERS,
+                 engine=QUERY_ENGINE, stop_event=None):
+    status_file = os.path.join(output_folder, STATUS_FILE_NAME)
+
+    # Extracts finished in an earlier run are skipped until the file changes; unfinished ones resume from their checkpoints
+    status = read_status(status_file)
+    done = {name: info.get('fingerprint') for name, info in status['files'].items() if info.get('state') == 'done'}
+    seen = {}
+    running = {}
+    failures = {}
+    retry_at = {}
+
+    print(f"[INFO] Watching {watch_dir} for new extracts...")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while stop_event is None or not stop_event.is_set():
+            # Failed extracts are retried with an exponential backoff
+            for file_name, future in list(running.items()):
+                if not future.done():
+                    continue
+                del running[file_name]
+                if future.exception() is None and future.result():
+                    done[file_name] = future.result()
+                    failures.pop(file_name, None)
+                else:
+                    failures[file_name] = failures.get(file_name, 0) + 1
+                    delay = min(poll_interval * 2 ** failures[file_name], MAX_RETRY_DELAY)
+                    retry_at[file_name] = time.time() + delay
+                    print(f"[INFO] Retrying {file_name} in {delay:.0f}s.")
+
+            try:
+                file_names = sorted(os.listdir(watch_dir))
+            except OSError as e:
+                print(f"[ERROR] Cannot scan {watch_dir}: {e}")
+                file_names = []
+
+            for file_name in file_names:
+                if not file_name.lower().endswith('.csv') or file_name in running:
+                    continue
+                if retry_at.get(file_name, 0) > time.time():
+                    continue
+                file_path = os.path.join(watch_dir, file_name)
+
+                try:
+                    fingerprint = input_fingerprint(file_path)
+                    if file_name in done:
+                        if done[file_name] == fingerprint:
+                            continue
+                        # The extract was replaced, e.g. re-downloaded under the same name
+                        del done[file_name]
+                        print(f"[INFO] {file_name} changed since it was processed.")
+
+                    # Only queue a file once its size and mtime are stable, so extracts still being copied are left alone
+                    if seen.get(file_name) != fingerprint:
+                        seen[file_name] = fingerprint
+                        continue
+
+                    update_status(status_file, file_name, state='queued')
+                    running[file_name] = pool.submit(process_file, file_path, output_folder, status_file, engine)
+                    print(f"[INFO] Queued {file_name}")
+                except OSError as e:
+                    # Files are often renamed or removed by copy tools between listing and stat
+                    seen.pop(file_name, None)
+                    print(f"[ERROR] Cannot queue {file_name}: {e}")
+            time.sleep(poll_interval)
+
+# ------------------------------
+# ENGINE BENCHMARK
+# ------------------------------
+
+def make_sample_data(n_rows, seed=42):
+    rng = np.random.default_rng(seed)
+    crime_types = ['ASSAULT', 'BATTERY', 'BURGLARY', 'HOMICIDE', 'NARCOTICS', 'ROBBERY', 'THEFT']
+    return pd.DataFrame({
+        'Year': rng.integers(2012, 2018, n_rows),
+        'Month': rng.integers(1, 13, n_rows),
+        'Primary Type': rng.choice(crime_types, n_rows),
+    })
+
+def benchmark_engines(sizes=BENCHMARK_SIZES):
+    if duckdb is None:
+        print("[ERROR] DuckDB is not installed, nothing to compare against pandas.")
+        return
+
+    for n_rows in sizes:
+        df = make_sample_data(n_rows)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            parquet_file = os.path.join(tmp_dir, 'sample.parquet')
+            df.to_parquet(parquet_file, index=False)
+
+            runs = {
+                'pandas (in memory)': lambda: reshape_data(df, 'pandas'),
+                'pandas (parquet)': lambda: reshape_data(pd.read_parquet(parquet_file), 'pandas'),
+                'duckdb (parquet)': lambda: reshape_data(df, 'duckdb', parquet_file),
+            }
+            results = {}
+            timings = {}
+            for name, run in runs.items():
+                start = time.perf_counter()
+                results[name] = run()
+                timings[name] = time.perf_counter() - start
+
+        # Every engine must produce the same tables as pandas
+        for name in runs:
+            for expected, actual in zip(results['pandas (in memory)'], results[name]):
+                pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+        print(f"[INFO] {n_rows:>10,} rows: " + ", ".join(f"{name} {timings[name]:.3f}s" for name in runs))
+
+# ------------------------------
+# MAIN EXECUTION
+# ------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chicago Crimes ETL Pipeline")
+    parser.add_argument('--watch', nargs='?', const=WATCH_FOLDER, metavar='FOLDER',
+                        help="Run as a service that processes new CSV extracts dropped into FOLDER")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS, help="Extracts processed at the same time")
+    parser.add_argument('--interval', type=float, default=POLL_INTERVAL, help="Seconds between folder scans")
+    parser.add_argument('--engine', choices=['duckdb', 'pandas'], default=QUERY_ENGINE,
+                        help="Query engine for the aggregation stage")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="Compare the query engines on synthetic data and check that their results match")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_engines()
+    elif args.watch:
+        watch_folder(args.watch, OUTPUT_FOLDER, args.interval, args.workers, args.engine)
+    else:
+        print("[INFO] Starting ETL pipeline...")
+        run_pipeline(INPUT_FILE, OUTPUT_FOLDER, engine=args.engine)
+        print("[SUCCESS] Pipeline finished successfully!")
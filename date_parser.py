@@ -0,0 +1,43 @@
+# ------------------------------
+# Date Parsing for Crime Data
+# ------------------------------
+# Shared by ETL Script.py and Dashboard.py
+
+import numpy as np
+import pandas as pd
+
+# Timestamp layout used by the Chicago Data Portal extracts
+DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+# Timestamp layout of the cleaned CSV written by pandas (YYYY-MM-DD HH:MM:SS)
+CLEANED_DATE_FORMAT = 'ISO8601'
+
+def to_naive_datetime(values, date_format):
+    # Time zone aware values are converted to UTC so every value shares one naive dtype
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce', utc=True)
+    return parsed.dt.tz_convert(None).astype('datetime64[ns]')
+
+def parse_values(values, date_format):
+    parsed = to_naive_datetime(values, date_format)
+
+    # Fall back to per-value format inference only for the values that did not match
+    unmatched = parsed.isna() & values.notna()
+    if unmatched.any():
+        parsed = parsed.combine_first(to_naive_datetime(values[unmatched], 'mixed'))
+    return parsed
+
+def parse_dates(dates, date_format=DATE_FORMAT):
+    # pandas parses ISO8601 in vectorized C code, so memoizing would cost more than it saves
+    if date_format == 'ISO8601':
+        return parse_values(dates, date_format)
+
+    # Parse each distinct timestamp string once, then broadcast back to all rows
+    codes, uniques = pd.factorize(dates)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=dates.index, dtype='datetime64[ns]', name=dates.name)
+    parsed = parse_values(pd.Series(uniques), date_format)
+
+    # Missing values have code -1
+    values = parsed.to_numpy().take(codes)
+    values[codes == -1] = np.datetime64('NaT')
+    return pd.Series(values, index=dates.index, name=dates.name)
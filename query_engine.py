@@ -0,0 +1,31 @@
+# ------------------------------
+# Query Engine for Crime Counts
+# ------------------------------
+# Used by ETL Script.py
+
+import pandas as pd
+
+# DuckDB is optional; the pandas code path is used when it is not installed
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+def count_rows(source, columns, count_name, engine='duckdb'):
+    # source is either a DataFrame or the path to a Parquet file
+    # DuckDB only pays off when it scans Parquet itself; handing it an in-memory frame is slower than pandas
+    if isinstance(source, str):
+        if engine == 'duckdb' and duckdb is not None:
+            return count_rows_duckdb(source, columns, count_name)
+        source = pd.read_parquet(source, columns=columns)
+    return source.groupby(columns).size().reset_index(name=count_name)
+
+def count_rows_duckdb(parquet_file, columns, count_name):
+    # NULL keys are dropped and keys sorted to match pandas groupby
+    keys = ', '.join(f'"{column}"' for column in columns)
+    not_null = ' AND '.join(f'"{column}" IS NOT NULL' for column in columns)
+    with duckdb.connect() as conn:
+        conn.read_parquet(parquet_file).create_view('crimes')
+        return conn.execute(
+            f'SELECT {keys}, COUNT(*) AS "{count_name}" FROM crimes WHERE {not_null} GROUP BY {keys} ORDER BY {keys}'
+        ).df()
@@ -0,0 +1,254 @@
+import importlib.util
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from date_parser import CLEANED_DATE_FORMAT, DATE_FORMAT, parse_dates
+from query_engine import count_rows
+
+ETL_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ETL Script.py')
+
+
+@pytest.fixture
+def etl(tmp_path, monkeypatch):
+    # The script name has a space, so load it by path; it creates OUTPUT_FOLDER on import
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location('etl_script', ETL_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_crimes(n_rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Year': rng.integers(2012, 2018, n_rows).astype(float),
+        'Month': rng.integers(1, 13, n_rows),
+        'Primary Type': rng.choice(['THEFT', 'BATTERY', 'NARCOTICS'], n_rows).astype(object),
+        'Date': pd.Timestamp('2016-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24, n_rows), unit='h'),
+    })
+    # NULL keys must be dropped by every engine, as pandas groupby does
+    df.loc[::17, 'Year'] = np.nan
+    df.loc[::23, 'Primary Type'] = None
+    return df
+
+
+def test_reshape_in_memory_uses_pandas(etl, monkeypatch):
+    # DuckDB is slower than pandas on in-memory frames, so it is only used for Parquet sources
+    monkeypatch.setattr('query_engine.count_rows_duckdb', None)
+    df = make_crimes()
+    for expected, actual in zip(etl.reshape_data(df, 'pandas'), etl.reshape_data(df, 'duckdb')):
+        pd.testing.assert_frame_equal(expected, actual)
+
+
+def test_reshape_parity_parquet(etl, tmp_path):
+    pytest.importorskip('duckdb')
+    df = make_crimes()
+    parquet_file = str(tmp_path / 'crimes.parquet')
+    df.to_parquet(parquet_file, index=False)
+    for expected, actual in zip(etl.reshape_data(df, 'pandas'), etl.reshape_data(df, 'duckdb', parquet_file)):
+        pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+
+def test_count_rows_parity_iso_week(tmp_path):
+    pytest.importorskip('duckdb')
+    df = make_crimes()
+    df['Week'] = df['Date'].dt.isocalendar().week
+    assert df['Week'].dtype == 'UInt32'
+    parquet_file = str(tmp_path / 'crimes.parquet')
+    df.to_parquet(parquet_file, index=False)
+
+    expected = count_rows(df, ['Week', 'Primary Type'], 'Incidents', engine='pandas')
+    actual = count_rows(parquet_file, ['Week', 'Primary Type'], 'Incidents', engine='duckdb')
+    pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+
+
+def test_parse_dates():
+    dates = pd.Series(['01/02/2016 11:40:00 PM', '2016-03-04 05:06:07', None, 'not a date', '01/02/2016 11:40:00 PM'])
+    parsed = parse_dates(dates)
+    assert parsed.tolist()[:2] == [pd.Timestamp('2016-01-02 23:40:00'), pd.Timestamp('2016-03-04 05:06:07')]
+    assert parsed[2:4].isna().all()
+    assert parsed[4] == parsed[0]
+
+    all_null = parse_dates(pd.Series([None, np.nan]))
+    assert pd.api.types.is_datetime64_any_dtype(all_null)
+    assert all_null.isna().all()
+
+
+@pytest.mark.parametrize('date_format', [DATE_FORMAT, CLEANED_DATE_FORMAT])
+def test_parse_dates_mixed_units_and_time_zones(date_format):
+    # Leftovers with nanoseconds or UTC offsets must not clash with the portal values
+    dates = pd.Series([
+        '01/02/2016 11:40:00 PM',
+        '2016-03-04 05:06:07.123456789',
+        '2016-03-04 05:06:07+00:00',
+        '2016-03-04 05:06:07+05:00',
+    ])
+    assert parse_dates(dates, date_format).tolist() == [
+        pd.Timestamp('2016-01-02 23:40:00'),
+        pd.Timestamp('2016-03-04 05:06:07.123456789'),
+        pd.Timestamp('2016-03-04 05:06:07'),
+        pd.Timestamp('2016-03-04 00:06:07'),
+    ]
+
+
+def write_extract(path, n_rows=200, seed=0):
+    # A small raw extract in the Chicago Data Portal layout
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2016-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n_rows), unit='min')
+    pd.DataFrame({
+        'ID': range(n_rows),
+        'Case Number': [f'HZ{i}' for i in range(n_rows)],
+        'Date': dates.strftime('%m/%d/%Y %I:%M:%S %p'),
+        'Block': rng.choice(['001XX N STATE ST', '002XX W MADISON ST'], n_rows),
+        'Primary Type': rng.choice(['theft', 'BATTERY '], n_rows),
+        'Description': 'SIMPLE',
+        'Location Description': 'STREET',
+        'Arrest': rng.integers(0, 2, n_rows).astype(bool),
+        'Domestic': False,
+        'Beat': 1011,
+        'District': 10,
+        'Ward': 24,
+        'Community Area': rng.integers(1, 77, n_rows).astype(float),
+        'Latitude': 41.8,
+        'Longitude': -87.6,
+    }).to_csv(path, index=False)
+
+
+def test_run_pipeline_writes_datetime_parquet(etl, tmp_path):
+    pytest.importorskip('pyarrow')
+    write_extract(tmp_path / 'extract.csv', n_rows=200)
+
+    # The default engine aggregates straight from the Parquet output
+    parquet_file = etl.run_pipeline(str(tmp_path / 'extract.csv'), str(tmp_path / 'out'),
+                                    db_file=str(tmp_path / 'out' / 'crimes.db'))
+    output = pd.read_parquet(parquet_file)
+    assert pd.api.types.is_datetime64_any_dtype(output['Date'])
+    assert not {'Date_x', 'Date_y'} & set(output.columns)
+
+    counts = pd.read_csv(tmp_path / 'out' / 'crime_counts_unpivot.csv')
+    assert counts['Crime_Count'].sum() == 200
+
+
+def crash_stage(monkeypatch, etl, name):
+    # Make one stage raise, as if the process crashed there
+    def crash(df):
+        raise RuntimeError(f'{name} crashed')
+    monkeypatch.setattr(etl, name, crash)
+
+
+def count_calls(monkeypatch, etl, name):
+    calls = []
+    original = getattr(etl, name)
+
+    def wrapper(*args):
+        calls.append(args)
+        return original(*args)
+    monkeypatch.setattr(etl, name, wrapper)
+    return calls
+
+
+def test_run_pipeline_resumes_after_failed_stage(etl, tmp_path, monkeypatch):
+    input_file = str(tmp_path / 'extract.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    write_extract(input_file)
+
+    with monkeypatch.context() as m:
+        crash_stage(m, etl, 'feature_engineering')
+        with pytest.raises(RuntimeError):
+            etl.run_pipeline(input_file, str(tmp_path / 'out'), str(tmp_path / 'crimes.db'), checkpoint_dir)
+    assert os.path.exists(etl.checkpoint_path(checkpoint_dir, 'clean'))
+
+    # The rerun starts from the 'clean' checkpoint and skips loading and cleaning
+    load_calls = count_calls(monkeypatch, etl, 'load_data')
+    clean_calls = count_calls(monkeypatch, etl, 'clean_data')
+    stages = []
+    etl.run_pipeline(input_file, str(tmp_path / 'out'), str(tmp_path / 'crimes.db'), checkpoint_dir,
+                     on_stage=stages.append)
+    assert not load_calls and not clean_calls
+    assert stages == ['features', 'save']
+    assert not os.path.exists(checkpoint_dir)
+
+
+def test_run_pipeline_discards_checkpoints_when_input_changes(etl, tmp_path, monkeypatch):
+    input_file = str(tmp_path / 'extract.csv')
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    write_extract(input_file, n_rows=200)
+
+    with monkeypatch.context() as m:
+        crash_stage(m, etl, 'feature_engineering')
+        with pytest.raises(RuntimeError):
+            etl.run_pipeline(input_file, str(tmp_path / 'out'), str(tmp_path / 'crimes.db'), checkpoint_dir)
+
+    # A corrected extract under the same name must be processed from scratch
+    write_extract(input_file, n_rows=300, seed=1)
+    load_calls = count_calls(monkeypatch, etl, 'load_data')
+    etl.run_pipeline(input_file, str(tmp_path / 'out'), str(tmp_path / 'crimes.db'), checkpoint_dir)
+    assert len(load_calls) == 1
+    assert len(pd.read_csv(tmp_path / 'out' / 'incidents.csv')) == 300
+
+
+def test_update_status_merges_fields(etl, tmp_path):
+    status_file = str(tmp_path / 'status.json')
+    etl.update_status(status_file, 'a.csv', state='running', stage='load')
+    etl.update_status(status_file, 'a.csv', stage='clean')
+    etl.update_status(status_file, 'b.csv', state='queued')
+
+    status = etl.read_status(status_file)
+    assert status['files'] == {'a.csv': {'state': 'running', 'stage': 'clean'}, 'b.csv': {'state': 'queued'}}
+    assert status['last_updated']
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def test_watch_folder_retries_failures_and_requeues_changed_files(etl, tmp_path, monkeypatch):
+    watch_dir = tmp_path / 'incoming'
+    output_folder = tmp_path / 'out'
+    watch_dir.mkdir()
+    output_folder.mkdir()
+    status_file = str(output_folder / etl.STATUS_FILE_NAME)
+    monkeypatch.setattr(etl, 'MAX_RETRY_DELAY', 1)
+    processed = count_calls(monkeypatch, etl, 'process_file')
+
+    def file_status(name):
+        return etl.read_status(status_file)['files'].get(name, {})
+
+    write_extract(watch_dir / 'good.csv')
+    pd.DataFrame({'No Date': [1]}).to_csv(watch_dir / 'bad.csv', index=False)
+
+    stop_event = threading.Event()
+    watcher = threading.Thread(target=etl.watch_folder,
+                               args=(str(watch_dir), str(output_folder), 0.2, 2, 'pandas', stop_event))
+    watcher.start()
+    try:
+        assert wait_for(lambda: file_status('good.csv').get('state') == 'done')
+        # The broken extract fails and is retried with a backoff
+        assert wait_for(lambda: sum(1 for args in processed if args[0].endswith('bad.csv')) >= 2)
+        assert file_status('bad.csv')['state'] == 'failed'
+
+        # A finished extract is not processed again while it is unchanged
+        good_runs = sum(1 for args in processed if args[0].endswith('good.csv'))
+        time.sleep(1)
+        assert sum(1 for args in processed if args[0].endswith('good.csv')) == good_runs
+
+        # Fixing the broken file and re-downloading the good one both trigger a new run
+        write_extract(watch_dir / 'bad.csv')
+        write_extract(watch_dir / 'good.csv', n_rows=300, seed=1)
+        assert wait_for(lambda: file_status('bad.csv').get('state') == 'done')
+        assert wait_for(lambda: file_status('good.csv').get('fingerprint') == etl.input_fingerprint(str(watch_dir / 'good.csv'))
+                        and file_status('good.csv').get('state') == 'done')
+        assert sum(1 for args in processed if args[0].endswith('good.csv')) == good_runs + 1
+    finally:
+        stop_event.set()
+        watcher.join(timeout=10)